@@ -1,18 +1,82 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import requests
+from fastapi.responses import ORJSONResponse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+import asyncio
+import hashlib
+import heapq
+import httpx
 import io
-from pdfminer.high_level import extract_text as pdf_extract_text
+import orjson
+import os
+import re
+import time
+import zipfile
+
+import lxml.etree as ET
+from pdfminer.high_level import extract_text_to_fp as pdf_extract_text_to_fp
 from docx import Document
+import pypdfium2 as pdfium
 
-API_KEY = "60299ec3b7mshaaff2aec49fb6b7p114bafjsn07c887579f76"   # ← METS TA CLÉ ICI
+# Clé lue au démarrage depuis l'environnement (rotation sans toucher au code) ;
+# la valeur en dur reste le repli pour le dev local.
+API_KEY = os.getenv("RAPIDAPI_KEY", "60299ec3b7mshaaff2aec49fb6b7p114bafjsn07c887579f76")
 API_HOST = "jsearch.p.rapidapi.com"
 
+# Mots vides FR/EN à exclure des mots-clés du CV.
+STOPWORDS = {
+    "avec", "pour", "dans", "cette", "votre", "notre", "nous", "vous", "elle",
+    "sont", "être", "avoir", "fait", "faire", "plus", "tous", "tout", "toute",
+    "toutes", "comme", "ainsi", "aussi", "leur", "leurs", "entre", "chez",
+    "depuis", "pendant", "afin", "dont", "mais", "donc", "alors", "très",
+    "bien", "sans", "sous", "auprès", "curriculum", "vitae",
+    "with", "from", "that", "this", "have", "been", "were", "their", "they",
+    "them", "than", "then", "when", "where", "which", "while", "will",
+    "would", "could", "should", "about", "into", "over", "under", "also",
+    "such", "more", "most", "some", "other", "each", "between", "during",
+    "resume",
+}
+
+# Compilé une fois au chargement du module : 4+ lettres ([^\W\d_] = toute
+# lettre Unicode, accents et ligatures compris, sans chiffres ni underscore).
+# Les mots vides sont exclus par le lookahead — le moteur C ne les émet jamais,
+# pas de test `in STOPWORDS` dans la boucle Python.
+_STOP_ALT = "|".join(sorted(STOPWORDS))
+_TOKEN_RE = re.compile(rf"\b(?!(?:{_STOP_ALT})\b)[^\W\d_]{{4,}}", re.IGNORECASE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un seul client HTTP partagé : réutilise les connexions TLS entre les requêtes,
+    # avec les en-têtes RapidAPI enregistrés une fois comme défauts.
+    app.state.http = httpx.AsyncClient(
+        # HTTP/2 : multiplexe les requêtes simultanées sur une connexion TLS.
+        http2=True,
+        # Budget borné : 3 s pour se connecter, 10 s au total.
+        timeout=httpx.Timeout(10, connect=3),
+        # Garder les connexions RapidAPI ouvertes 60 s : les appels suivants
+        # réutilisent la session TLS au lieu de repayer le handshake.
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20,
+                            keepalive_expiry=60),
+        headers={
+            "X-RapidAPI-Key": API_KEY,
+            "X-RapidAPI-Host": API_HOST,
+        },
+    )
+    yield
+    await app.state.http.aclose()
+
+
 app = FastAPI(
     title="JobMatch Assistant PRO",
     description="Analyse ton CV + recherches sur toutes les plateformes d’emploi.",
-    version="6.0.0"
+    version="6.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -23,62 +87,203 @@ app.add_middleware(
 )
 
 
-def extract_text(upload: UploadFile) -> str:
-    content = upload.file.read()
-    filename = upload.filename.lower()
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10 Mo : borne la mémoire par upload
+MAX_PDF_PAGES = 20  # un CV fait 1-3 pages ; au-delà, le reste n'apporte rien
+
+# Pool de processus pour l'extraction (CPU-bound) : l'event loop reste libre
+# et les uploads simultanés se répartissent sur les cœurs malgré le GIL.
+EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+
+def _extract_sync(content: bytes, filename: str) -> str:
+    # Fonction top-level sur (bytes, str) : picklable pour le pool de processus.
+    filename = filename.lower()
 
     if filename.endswith(".pdf"):
-        return pdf_extract_text(io.BytesIO(content))
+        try:
+            # PDFium (C++) : extraction 10-50x plus rapide que pdfminer.
+            # Page par page, en refermant chaque handle natif : la mémoire
+            # de pointe reste celle d'une page, pas du document.
+            pdf = pdfium.PdfDocument(io.BytesIO(content))
+            parts = []
+            for i, page in enumerate(pdf):
+                if i >= MAX_PDF_PAGES:
+                    page.close()
+                    break
+                textpage = page.get_textpage()
+                parts.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            pdf.close()
+            return "\n".join(parts)
+        except Exception:
+            # PDF récalcitrant : pdfminer est plus lent mais plus tolérant.
+            # Sans LAParams : on veut des mots, pas une mise en page.
+            out = io.StringIO()
+            pdf_extract_text_to_fp(io.BytesIO(content), out)
+            return out.getvalue()
 
     if filename.endswith(".docx"):
-        doc = Document(io.BytesIO(content))
-        return "\n".join([p.text for p in doc.paragraphs])
+        try:
+            # Lire word/document.xml directement : pas de graphe d'objets
+            # python-docx (styles, runs) pour du texte brut.
+            w = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+            with zipfile.ZipFile(io.BytesIO(content)) as z:
+                root = ET.parse(z.open("word/document.xml")).getroot()
+            return "\n".join(
+                "".join(t.text for t in p.iter(w + "t") if t.text)
+                for p in root.iter(w + "p")
+            )
+        except Exception:
+            doc = Document(io.BytesIO(content))
+            return "\n".join([p.text for p in doc.paragraphs])
 
-    try:
-        return content.decode("utf-8", errors="ignore")
-    except:
-        return content.decode(errors="ignore")
+    # errors="ignore" ne lève jamais : un seul décodage suffit.
+    return content.decode("utf-8", "ignore")
 
 
-@app.post("/api/match")
-async def match_jobs(cv: UploadFile = File(...)):
-    text = extract_text(cv)
+# Cache TTL en mémoire : les mêmes mots-clés reviennent souvent
+# (plusieurs CV similaires, re-upload), inutile de re-payer l'API.
+_SEARCH_CACHE = {}
+_SEARCH_TTL = 1800  # secondes
+_SEARCH_CACHE_MAX = 512  # entrées
 
-    if len(text.strip()) < 20:
-        raise HTTPException(status_code=400, detail="CV vide ou illisible.")
 
-    # Utiliser les premiers mots du CV comme mots-clés
-    words = [w for w in text.split() if len(w) > 3]
-    query = " ".join(words[:5])  # mots clés pour la recherche
+def _cache_put(cache: dict, max_entries: int, key, value):
+    # Purge les entrées expirées quand le cache est plein ; si tout est
+    # encore frais, évince la plus ancienne (ordre d'insertion du dict).
+    if len(cache) >= max_entries:
+        now = time.monotonic()
+        for k in [k for k, v in cache.items() if v[0] <= now]:
+            del cache[k]
+        if len(cache) >= max_entries:
+            del cache[next(iter(cache))]
+    cache[key] = value
 
-    url = "https://jsearch.p.rapidapi.com/search"
 
-    headers = {
-        "X-RapidAPI-Key": API_KEY,
-        "X-RapidAPI-Host": API_HOST
-    }
+# Même CV re-soumis (refresh, autres filtres) : le profil extrait est
+# déterministe sur les octets, on le mémoïse par empreinte du fichier.
+_PROFILE_CACHE = {}
+_PROFILE_TTL = 3600  # secondes
+_PROFILE_CACHE_MAX = 256  # entrées
+
+
+_SEARCH_URL = "https://jsearch.p.rapidapi.com/search"
+
+# Champs jsearch → clés de la réponse, extraits en un seul appel C par offre.
+_OFFER_FIELDS = itemgetter(
+    "job_title", "employer_name", "job_city",
+    "job_description", "job_apply_link", "job_posted_at",
+)
+_OFFER_KEYS = ("title", "company", "location", "description", "url", "source")
+_SEARCH_PAGES = 2  # pages jsearch récupérées par requête
+_FETCH_SEM = asyncio.Semaphore(4)  # borne la concurrence vers RapidAPI
 
+
+async def _fetch_page(query: str, page: int) -> list:
     params = {
         "query": query,
+        "page": str(page),
         "num_pages": "1"
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    async with _FETCH_SEM:
+        try:
+            response = await app.state.http.get(_SEARCH_URL, params=params)
+        except httpx.HTTPError:
+            # Amont lent ou injoignable : mieux vaut 0 offre qu'une 500.
+            return []
 
     if response.status_code != 200:
         return []
 
-    data = response.json().get("data", [])
+    # Décodage orjson (C) plutôt que le parseur json de la stdlib.
+    return orjson.loads(response.content).get("data", [])
+
+
+async def fetch_jobs(query: str) -> list:
+    cached = _SEARCH_CACHE.get(query)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    # Pages en parallèle : la latence totale = la page la plus lente,
+    # pas la somme des pages.
+    pages = await asyncio.gather(
+        *(_fetch_page(query, p) for p in range(1, _SEARCH_PAGES + 1))
+    )
+    data = [job for page in pages for job in page]
+
+    if data:
+        _cache_put(_SEARCH_CACHE, _SEARCH_CACHE_MAX, query, (time.monotonic() + _SEARCH_TTL, data))
+        return data
+
+    if cached:
+        # Amont en panne ou vide : servir l'entrée périmée plutôt que rien.
+        return cached[1]
+    return []
+
+
+@app.post("/api/match")
+async def match_jobs(cv: UploadFile = File(...), only_paid: bool = False):
+    content = await cv.read(MAX_UPLOAD_BYTES + 1)
+    if len(content) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="CV trop volumineux (max 10 Mo).")
+    # BLAKE2 sur ~1 Mo coûte ~1 ms ; l'extraction, des centaines.
+    digest = hashlib.blake2b(content, digest_size=16).digest()
+    cached = _PROFILE_CACHE.get(digest)
+    if cached and cached[0] > time.monotonic():
+        freq = cached[1]
+    else:
+        loop = asyncio.get_event_loop()
+        text = await loop.run_in_executor(EXECUTOR, _extract_sync, content, cv.filename)
+
+        if len(text.strip()) < 20:
+            raise HTTPException(status_code=400, detail="CV vide ou illisible.")
+
+        # Mots-clés = les 5 mots les plus fréquents du CV (hors mots vides).
+        # Le motif est insensible à la casse : pas de copie text.lower() du CV
+        # entier, seuls les tokens retenus sont abaissés.
+        freq = Counter(m.group().lower() for m in _TOKEN_RE.finditer(text))
+
+        # Élaguer les mots vus une seule fois (surtout du bruit) avant le top-K —
+        # sauf si le CV est trop court pour qu'il en reste assez.
+        pruned = Counter({w: c for w, c in freq.items() if c >= 2})
+        if len(pruned) >= 5:
+            freq = pruned
 
+        _cache_put(_PROFILE_CACHE, _PROFILE_CACHE_MAX, digest,
+                   (time.monotonic() + _PROFILE_TTL, freq))
+    query = " ".join(w for w, _ in freq.most_common(5))
+
+    data = await fetch_jobs(query)
+
+    # Score de pertinence : une alternation compilée une fois par requête,
+    # une seule passe C par offre au lieu d'un `in` Python par mot-clé.
+    keywords = [w for w, _ in freq.most_common(25)]
+    pattern = re.compile("|".join(re.escape(k) for k in keywords)) if keywords else None
+
+    # Déduplication au fil de l'eau : un set de clés, premier vu gardé.
+    seen = set()
     results = []
     for job in data:
-        results.append({
-            "title": job.get("job_title"),
-            "company": job.get("employer_name"),
-            "location": job.get("job_city"),
-            "description": job.get("job_description"),
-            "url": job.get("job_apply_link"),
-            "source": job.get("job_posted_at"),
-        })
-
-    return results[:20]  # 20 offres minimum
+        # Filtrer avant de scorer : pas de passe regex sur des offres écartées.
+        if only_paid and not (job.get("job_min_salary") or job.get("job_max_salary")):
+            continue
+        fields = _OFFER_FIELDS(job)
+        title, _, _, description, apply_link, _ = fields
+        key = (title, fields[1], apply_link)
+        if key in seen:
+            continue
+        seen.add(key)
+        txt = " ".join(filter(None, (title, description))).lower()
+        score = 0.5
+        if pattern:
+            # Mots-clés distincts trouvés : 50 occurrences d'un même mot
+            # ne valent pas 50 mots-clés couverts.
+            score = min(0.99, round(score + 0.01 * len(set(pattern.findall(txt))), 2))
+        offer = dict(zip(_OFFER_KEYS, fields))
+        offer["score"] = score
+        results.append(offer)
+
+    # Top-20 par score : O(n log 20) au lieu d'un tri complet.
+    return heapq.nlargest(20, results, key=itemgetter("score"))